@@ -38,8 +38,10 @@
 
     '''
 import heapq
+import itertools
 from collections import deque
 import os
+import time
 
 
 class StateSpace:
@@ -48,6 +50,9 @@ class StateSpace:
     '''Abstract class for defining State spaces for search routines'''
     n = 0
 
+    # subclasses may define __slots__ too, so that states carry no __dict__
+    __slots__ = ('action', 'gval', 'parent', 'index')
+
     def __init__(self, action, gval, parent):
         '''Problem specific state space objects must always include the data items
            a) self.action === the name of the action used to generate
@@ -127,9 +132,10 @@ _ASTAR = 3
 _UCS = 4
 _CUSTOM = 5
 
-# For best first and astar we use a priority queue. This requires
-# a comparison function for nodes. These constants indicate if we use
-# the gval, the hval or the sum of gval and hval in the comparison.
+# For ucs, best first, astar and custom we use a priority queue. The
+# priority of a node is computed once, when it is inserted into OPEN.
+# These constants indicate if we use the gval, the hval, the sum of gval
+# and hval or the custom fval as the priority.
 _SUM_HG = 0
 _H = 1
 _G = 2
@@ -164,7 +170,6 @@ class sNode:
     node object for convenience), and the number of the node'''
 
     n = 0
-    lt_type = _SUM_HG
 
     def __init__(self, state, hval, fval_function):
         self.state = state
@@ -174,35 +179,117 @@ class sNode:
         self.fval_function = fval_function
         sNode.n = sNode.n + 1
 
-    def __lt__(self, other):
-        '''For astar and best first we use a priority queue for the
-           OPEN set. This queue stores search nodes waiting to be
-           expanded. Thus we need to define a node1 < node2 function
-           by defining the __lt__ function. Dependent on the type of
-           search this comparison function compares the h-value, the
-           g-value or the f-value of the nodes. Note for the f-value
-           we wish to break ties by letting node1 < node2 if they both
-           have identical f-values but if node1 has a GREATER g
-           value. This means that we expand nodes along deeper paths
-           first causing the search to proceed directly to the goal'''
-
-        if sNode.lt_type == _SUM_HG:
-            if (self.gval+self.hval) == (other.gval+other.hval):
-                # break ties by greatest gval.
-                return self.gval > other.gval
-            else:
-                return ((self.gval+self.hval) < (other.gval+other.hval))
-        if sNode.lt_type == _G:
-            return self.gval < other.gval
-        if sNode.lt_type == _H:
-            return self.hval < other.hval
-        if sNode.lt_type == _C:
-            return self.fval_function(self) < other.fval_function(other)
-
-        print('sNode class has invalid comparator setting!')
 
-        # return default of lowest gval (generating UCS behavior)
-        return self.gval < other.gval
+# Functions computing the (priority, tiebreak) key of a node for each
+# priority type. Nodes with a lower priority are extracted first; among
+# nodes with equal priority the one with the GREATER tiebreak goes first,
+# unless the priority type is in _SMALLEST_TIEBREAK_FIRST.
+# For the f-value (and a custom f-value) we break ties by greatest g
+# value. This means that we expand nodes along deeper paths first causing
+# the search to proceed directly to the goal. For the h-value we break
+# ties by smallest g value: g does not bring a node with the same h any
+# closer to the goal, and preferring the shorter path keeps the search
+# from wandering down long paths across states of equal h.
+_PRIORITY = {
+    _SUM_HG: lambda node: (node.gval + node.hval, node.gval),
+    _H: lambda node: (node.hval, node.gval),
+    _G: lambda node: (node.gval, 0),
+    _C: lambda node: (node.fval_function(node), node.gval),
+}
+
+_SMALLEST_TIEBREAK_FIRST = {_H}
+
+
+class Bucket:
+    '''The nodes of a BucketQueue that share one priority. Nodes are kept
+       in FIFO queues indexed by a small non-negative integer tie-breaker
+       and the node with the GREATEST tie-breaker (or the smallest, if
+       greatest_first is False) is extracted first. Nodes with the same
+       tie-breaker come out in insertion order'''
+
+    def __init__(self, greatest_first=True):
+        self.queues = []
+        self.greatest_first = greatest_first
+        self.next = 0  # no non-empty queue lies beyond next in pop order
+        self.size = 0
+
+    def push(self, node, tiebreak):
+        while len(self.queues) <= tiebreak:
+            self.queues.append(deque())
+        self.queues[tiebreak].append(node)
+        if not self.size or (tiebreak > self.next if self.greatest_first
+                             else tiebreak < self.next):
+            self.next = tiebreak
+        self.size = self.size + 1
+
+    def pop(self):
+        step = -1 if self.greatest_first else 1
+        while not self.queues[self.next]:
+            self.next = self.next + step
+        self.size = self.size - 1
+        return self.queues[self.next].popleft()
+
+    def __iter__(self):
+        for queue in self.queues:
+            for node in queue:
+                yield node
+
+
+class BucketQueue:
+    '''A priority queue for small non-negative integer priorities. Each
+       priority has its own Bucket in a list indexed by the priority, so
+       insert is O(1) and extract only has to advance a pointer to the
+       lowest non-empty bucket; no node comparisons are made. Nodes with
+       an infinite priority (e.g., a heuristic that detected a dead end)
+       are kept in a separate bucket that is served last. greatest_first
+       gives the tie-breaker order within a priority, see Bucket'''
+
+    # priorities above this are handled by falling back to a heap
+    max_priority = 1 << 16
+
+    def __init__(self, greatest_first=True):
+        self.buckets = []
+        self.greatest_first = greatest_first
+        self.infinite = Bucket(greatest_first)
+        self.lowest = 0
+        self.size = 0
+
+    @staticmethod
+    def accepts(priority, tiebreak):
+        '''Return True if (priority, tiebreak) can be stored in a BucketQueue'''
+        return (type(tiebreak) is int and 0 <= tiebreak <= BucketQueue.max_priority and
+                (priority == float("inf") or
+                 (type(priority) is int and 0 <= priority <= BucketQueue.max_priority)))
+
+    def insert(self, node, priority, tiebreak=0):
+        if priority == float("inf"):
+            bucket = self.infinite
+        else:
+            while len(self.buckets) <= priority:
+                self.buckets.append(Bucket(self.greatest_first))
+            bucket = self.buckets[priority]
+            if priority < self.lowest:
+                self.lowest = priority
+        bucket.push(node, tiebreak)
+        self.size = self.size + 1
+
+    def extract(self):
+        while self.lowest < len(self.buckets) and not self.buckets[self.lowest].size:
+            self.lowest = self.lowest + 1
+        self.size = self.size - 1
+        if self.lowest < len(self.buckets):
+            return self.buckets[self.lowest].pop()
+        return self.infinite.pop()
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            for node in bucket:
+                yield node
+        for node in self.infinite:
+            yield node
 
 
 class Open:
@@ -210,7 +297,13 @@ class Open:
        nodes. Depending on the search strategy used we want to extract
        nodes from this set in different orders, so set up the object's
        functions to operate as needed by the particular search
-       strategy'''
+       strategy.
+
+       For ucs, best first and astar the priorities of the snowman domain
+       are small integers (unit costs and integer heuristics), so OPEN
+       starts out as a BucketQueue. The first time a node with a priority
+       the BucketQueue cannot store is inserted, all nodes are moved to a
+       heap and the heap is used from then on'''
 
     def __init__(self, search_strategy):
         if search_strategy == _DEPTH_FIRST:
@@ -218,54 +311,142 @@ class Open:
             self.open = []
             self.insert = self.open.append
             self.extract = self.open.pop
+            self.nodes = lambda: iter(self.open)
         elif search_strategy == _BREADTH_FIRST:
             # use queue for OPEN (first in---earliest node not yet expanded---is first out)
             self.open = deque()
             self.insert = self.open.append
             self.extract = self.open.popleft
+            self.nodes = lambda: iter(self.open)
         elif search_strategy == _UCS:
             # use priority queue for OPEN (first out is node with lowest gval)
-            self.open = []
-            # set node less than function to compare gvals only
-            sNode.lt_type = _G
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            self._set_priority(_G)
+            self._use_buckets()
         elif search_strategy == _BEST_FIRST:
             # use priority queue for OPEN (first out is node with lowest hval)
-            self.open = []
-            # set node less than function to compare hvals only
-            sNode.lt_type = _H
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            self._set_priority(_H)
+            self._use_buckets()
         elif search_strategy == _ASTAR:
             # use priority queue for OPEN (first out is node with lowest fval = gval+hval)
-            self.open = []
-            # set node less than function to compare sums of hval and gval
-            sNode.lt_type = _SUM_HG
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            self._set_priority(_SUM_HG)
+            self._use_buckets()
         elif search_strategy == _CUSTOM:
             # use priority queue for OPEN (first out is node with lowest fval)
+            self._set_priority(_C)
+            self.open = []
+            self._use_heap()
+
+    def _set_priority(self, priority_type):
+        self.priority = _PRIORITY[priority_type]
+        self.greatest_first = priority_type not in _SMALLEST_TIEBREAK_FIRST
+
+    def _use_buckets(self):
+        self.open = BucketQueue(self.greatest_first)
+        self.insert = self._insert_bucket
+        self.extract = self.open.extract
+        self.nodes = lambda: iter(self.open)
+
+    def _use_heap(self):
+        # The heap holds (priority, -tiebreak, count, node) tuples (or
+        # +tiebreak when smaller tiebreaks go first) so that heapq only
+        # compares numbers. count comes from a counter owned by
+        # this Open, so it is unique within the heap even when another
+        # engine resets sNode.n, and nodes with equal keys come out in
+        # insertion order.
+        self.counter = itertools.count()
+        self.insert = self._insert_heap
+        self.extract = lambda: heapq.heappop(self.open)[3]
+        self.nodes = lambda: (entry[3] for entry in self.open)
+
+    def _insert_heap(self, node):
+        priority, tiebreak = self.priority(node)
+        if self.greatest_first:
+            tiebreak = -tiebreak
+        heapq.heappush(self.open, (priority, tiebreak, next(self.counter), node))
+
+    def _insert_bucket(self, node):
+        priority, tiebreak = self.priority(node)
+        if BucketQueue.accepts(priority, tiebreak):
+            self.open.insert(node, priority, tiebreak)
+        else:
+            # move everything to a heap
+            nodes = list(self.open)
             self.open = []
-            # set node less than function to compare sums of fval
-            sNode.lt_type = _C
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
+            self._use_heap()
+            for nd in nodes:
+                self.insert(nd)
+            self.insert(node)
 
     def empty(self): return not self.open
 
+    def __len__(self): return len(self.open)
+
     def print_open(self):
         print("{", end="")
-        if len(self.open) == 1:
-            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(self.open[0].state.index, self.open[0].state.action, self.open[0].state.hashable_state(
-            ), self.open[0].gval, self.open[0].hval, self.open[0].gval+self.open[0].hval), end="")
-        else:
-            for nd in self.open:
-                print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action,
-                                                                    nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
+        for nd in self.nodes():
+            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action,
+                                                                nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
         print("}")
 
 
+class SearchStats:
+    '''Statistics of one search, i.e., of everything done since the last
+       call to init_search (resumed searches add to the same object).
+       The time fields are only filled in when profiling is on (see
+       SearchEngine.profile_on); they are wall-clock seconds spent in
+       the heuristic function, in successors() and in the goal function'''
+
+    def __init__(self):
+        self.expanded = 0             # nodes whose successors were generated
+        self.generated = 0            # successor states generated
+        self.cycle_check_pruned = 0   # successors pruned by cycle checking (duplicates)
+        self.stale_skipped = 0        # extracted nodes skipped, state already reached more cheaply
+        self.cost_bound_pruned = 0    # successors pruned by the cost bound
+        self.peak_open = 0            # largest size of OPEN
+        self.peak_cc_dictionary = 0   # largest size of the cycle check dictionary
+        self.search_time = 0.0        # CPU time spent in search (os.times)
+        self.heuristic_calls = 0
+        self.heuristic_time = 0.0
+        self.successors_calls = 0
+        self.successors_time = 0.0
+        self.goal_calls = 0
+        self.goal_time = 0.0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def print_stats(self):
+        print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, "
+              "nodes skipped as stale = {}, states cost bound pruned = {}".format(
+                  self.expanded, self.generated, self.cycle_check_pruned,
+                  self.stale_skipped, self.cost_bound_pruned))
+        print("Peak OPEN size = {}, peak cycle check dictionary size = {}, search time = {:.2f} sec".format(
+            self.peak_open, self.peak_cc_dictionary, self.search_time))
+        if self.heuristic_calls or self.successors_calls or self.goal_calls:
+            print("Heuristic: {} calls in {:.3f} sec, successors: {} calls in {:.3f} sec, goal test: {} calls in {:.3f} sec".format(
+                self.heuristic_calls, self.heuristic_time, self.successors_calls,
+                self.successors_time, self.goal_calls, self.goal_time))
+
+
+def _successors(state):
+    return state.successors()
+
+
+def _timed(fn, stats, name):
+    '''Return a function that calls fn and adds the call and the time it
+       took to the <name>_calls and <name>_time fields of stats'''
+    calls = name + '_calls'
+    total = name + '_time'
+
+    def timed_fn(arg):
+        start = time.perf_counter()
+        result = fn(arg)
+        setattr(stats, total, getattr(stats, total) + time.perf_counter() - start)
+        setattr(stats, calls, getattr(stats, calls) + 1)
+        return result
+    return timed_fn
+
+
 class SearchEngine:
 
     # An object of class SearchEngine and with the name se runs the search procedure. A SearchEngine object is initialized with a search strategy (’depth ﬁrst’, ’breadth ﬁrst’, ’best ﬁrst’, ’a star’ or ’custom’) and a cycle checking level (’none’, ’path’, or ’full’).
@@ -282,12 +463,23 @@ class SearchEngine:
         # if set to custom, you will have to specify the way that f-values of nodes are calculated; these values will structure the order of the nodes that are expanded during your search.
 
         self.trace = 0
+        self.profile = False
+        self.stats = SearchStats()
 
     def initStats(self):
         sNode.n = 0
         StateSpace.n = 1  # initial state already generated on call so search
-        self.cycle_check_pruned = 0
-        self.cost_bound_pruned = 0
+        self.stats = SearchStats()
+
+    def profile_on(self):
+        '''Time the heuristic, successor and goal test calls of the search
+           in self.stats. This adds a timer around every call, so it is
+           off by default'''
+        self.profile = True
+
+    def profile_off(self):
+        '''Turn off timing of calls'''
+        self.profile = False
 
     def trace_on(self, level=1):
         '''For debugging, set tracking level 1 or 2'''
@@ -397,11 +589,55 @@ class SearchEngine:
             self.cc_dictionary = dict()
             self.cc_dictionary[initState.hashable_state()] = initState.gval
 
+        # for path checking, the states on the path to the node being
+        # expanded (see _move_path_to)
+        if self.cycle_check == _CC_PATH:
+            self.path_counts = dict()
+            self.path_ids = set()
+            self.path_tip = None
+
         self.open.insert(node)
         self.fval_function = fval_function
         self.goal_fn = goal_fn
         self.heur_fn = heur_fn
 
+    def _move_path_to(self, state):
+        '''Make the path of state (state and all its ancestors) the
+           current path. self.path_counts counts the hashable states on
+           the current path, so path checking a successor of state is a
+           single dictionary lookup instead of a walk up the parent chain.
+
+           The current path is only changed where it differs from the
+           path of state: states are removed from its end back to the
+           deepest common ancestor, then the new states are added. When
+           depth first search expands a child of the previous node this
+           is a single addition, and in general each state is added and
+           removed at most once per time it is expanded.'''
+        # the states on the new path that are not on the current path
+        new_states = []
+        s = state
+        while s is not None and id(s) not in self.path_ids:
+            new_states.append(s)
+            s = s.parent
+
+        # remove states from the end of the current path back to s
+        tip = self.path_tip
+        while tip is not s:
+            hash_state = tip.hashable_state()
+            if self.path_counts[hash_state] == 1:
+                del self.path_counts[hash_state]
+            else:
+                self.path_counts[hash_state] -= 1
+            self.path_ids.remove(id(tip))
+            tip = tip.parent
+
+        while new_states:
+            s = new_states.pop()
+            hash_state = s.hashable_state()
+            self.path_counts[hash_state] = self.path_counts.get(hash_state, 0) + 1
+            self.path_ids.add(id(s))
+        self.path_tip = state
+
     def search(self, timebound=None, costbound=None):
 
         # exectuting the searchs
@@ -420,18 +656,18 @@ class SearchEngine:
         goal_node = self._searchOpen(
             self.goal_fn, self.heur_fn, self.fval_function, costbound)
 
+        total_search_time = os.times()[0] - self.search_start_time
+        self.stats.search_time = self.stats.search_time + total_search_time
         if goal_node:
-            total_search_time = os.times()[0] - self.search_start_time
-            #print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, total_search_time))
-            # print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-            #    sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
+            if self.trace:
+                print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, total_search_time))
+                self.stats.print_stats()
             return goal_node.state
         else:
             # exited the while without finding goal---search failed
-            total_search_time = os.times()[0] - self.search_start_time
-            #print("Search Failed! No solution found.")
-            # print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-            #    sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
+            if self.trace:
+                print("Search Failed! No solution found.")
+                self.stats.print_stats()
             return False
 
     def _searchOpen(self, goal_fn, heur_fn, fval_function, costbound):
@@ -450,6 +686,13 @@ class SearchEngine:
             if self.cycle_check == _CC_FULL:
                 print("   TRACE: Initial CC_Dict:", self.cc_dictionary)
         # END TRACING
+        stats = self.stats
+        get_successors = _successors
+        if self.profile:
+            goal_fn = _timed(goal_fn, stats, 'goal')
+            heur_fn = _timed(heur_fn, stats, 'heuristic')
+            get_successors = _timed(get_successors, stats, 'successors')
+        stats.peak_open = max(stats.peak_open, len(self.open))
         while not self.open.empty():
             node = self.open.extract()
 
@@ -486,9 +729,15 @@ class SearchEngine:
             # END TRACING
 
             if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
+                stats.stale_skipped = stats.stale_skipped + 1
                 continue
 
-            successors = node.state.successors()
+            if self.cycle_check == _CC_PATH:
+                self._move_path_to(node.state)
+
+            successors = get_successors(node.state)
+            stats.expanded = stats.expanded + 1
+            stats.generated = stats.generated + len(successors)
 
             # BEGIN TRACING
             if self.trace:
@@ -525,11 +774,11 @@ class SearchEngine:
                               succ.gval > self.cc_dictionary[hash_state]
                               ) or (
                     self.cycle_check == _CC_PATH and
-                    succ.has_path_cycle()
+                    hash_state in self.path_counts
                 )
 
                 if prune_succ:
-                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    stats.cycle_check_pruned = stats.cycle_check_pruned + 1
                     # BEGIN TRACING
                     if self.trace > 1:
                         print(" TRACE: Successor State pruned by cycle checking")
@@ -541,7 +790,7 @@ class SearchEngine:
                 if costbound is not None and (succ.gval > costbound[0] or
                                               succ_hval > costbound[1] or
                                               succ.gval + succ_hval > costbound[2]):
-                    self.cost_bound_pruned = self.cost_bound_pruned + 1
+                    stats.cost_bound_pruned = stats.cost_bound_pruned + 1
                     if self.trace > 1:
                         print(
                             " TRACE: Successor State pruned, over current cost bound of {}", costbound)
@@ -561,5 +810,10 @@ class SearchEngine:
                 if self.cycle_check == _CC_FULL:
                     self.cc_dictionary[hash_state] = succ.gval
 
+            if len(self.open) > stats.peak_open:
+                stats.peak_open = len(self.open)
+            if self.cycle_check == _CC_FULL and len(self.cc_dictionary) > stats.peak_cc_dictionary:
+                stats.peak_cc_dictionary = len(self.cc_dictionary)
+
         # end of while--OPEN is empty and no solution
         return False
@@ -11,13 +11,92 @@
     Code also contains a list of 40 Snowball problems for the purpose of testing.
 """
 
+import random
+
 from search import *
 
 
+# A snowball (or stack of snowballs) is packed into one int: cell << _SIZE_BITS | size index.
+_SIZE_BITS = 3
+_SIZE_MASK = (1 << _SIZE_BITS) - 1
+
+
+class SnowmanLevel:
+
+    # The static data of a Snowman Puzzle: the board dimensions, the obstacles and the destination.
+    # A level is shared by every state of a search so that states only have to store what changes:
+    # the robot cell and the snowballs.
+
+    # Locations are encoded as cell numbers, cell = y * width + x.
+
+    def __init__(self, width, height, obstacles, destination):
+        self.width = width
+        self.height = height
+        self.obstacles = obstacles
+        self.destination = destination
+        self.destination_cell = self.cell(destination)
+        self.coords = [(cell % width, cell // width)
+                       for cell in range(width * height)]
+
+        # moves[d][cell] is the cell reached by moving from cell in direction DIRECTIONS[d],
+        # or -1 if that is off the board or an obstacle.
+        self.moves = []
+        for direction in DIRECTIONS:
+            moves = []
+            for location in self.coords:
+                x, y = direction.move(location)
+                if 0 <= x < width and 0 <= y < height and (x, y) not in obstacles:
+                    moves.append(self.cell((x, y)))
+                else:
+                    moves.append(-1)
+            self.moves.append(moves)
+
+        # Zobrist keys: one random 64-bit number per robot cell and per packed snowball.
+        # The key of a state is the XOR of the numbers of its robot cell and snowballs.
+        rng = random.Random(0)
+        self.robot_keys = [rng.getrandbits(64) for _ in self.coords]
+        self.ball_keys = [rng.getrandbits(64)
+                          for _ in range(len(self.coords) << _SIZE_BITS)]
+
+    def cell(self, location):
+        return location[1] * self.width + location[0]
+
+    def compute_key(self, robot_cell, balls):
+        key = self.robot_keys[robot_cell]
+        for ball in balls:
+            key ^= self.ball_keys[ball]
+        return key
+
+
+_levels = dict()
+
+
+def get_level(width, height, obstacles, destination):
+    """
+    Return the shared SnowmanLevel with the given static data.
+    """
+    key = (width, height, obstacles, destination)
+    if key not in _levels:
+        _levels[key] = SnowmanLevel(width, height, obstacles, destination)
+    return _levels[key]
+
+
 class SnowmanState(StateSpace):
 
     # a StateSpace with additional key attributes
 
+    # A state only stores its level, the robot cell, a sorted tuple of packed snowballs and its
+    # Zobrist key. width, height, robot, snowballs, obstacles and destination are computed from
+    # these on access.
+    __slots__ = ('level', 'robot_cell', 'balls', 'key')
+
+    # snowball sizes: 'b' is 'big', 'm' is 'medium' and 's' is small.
+    # A type 'G' snowman is a complete snowman.
+    # A type 'A' snowman is formed by placing a medium snowball atop big one.
+    # A type 'B' snowman is formed by placing a small snowball atop medium one.
+    # A type 'C' snowman is formed by placing a small snowball atop big one.
+    snowball_sizes = {0: 'b', 1: 'm', 2: 's', 3: 'A', 4: 'B', 5: 'C', 6: 'G'}
+
     def __init__(self, action, gval, parent, width, height, robot, snowballs, obstacles, destination):
 
         # width: the width of the Snowman Puzzle board
@@ -38,20 +117,49 @@ class SnowmanState(StateSpace):
         # sizes: contains the key, value pairs that indicate snowball sizes or the presence of a snowball stack. The possible values are: ’b’ for a big snowball, ’m’ for a medium snowball, and ’s’ for a small one. A ’G’ denotes a completed snowperson. In addition, note that there are values to indicate stacks of snowballs on the board: ’A’ represents a medium snowball atop big one, ’B’ represents a small snowball atop big one and ’C’ represents a small snowball atop medium one. See Figure 2 for snowballs as they are represented by the ASCII visualizer you have been provided.
 
         StateSpace.__init__(self, action, gval, parent)
-        self.width = width
-        self.height = height
-        self.robot = robot
-        self.destination = destination
-        self.snowballs = snowballs
-        self.obstacles = obstacles
-
-        # snowball sizes: 'b' is 'big', 'm' is 'medium' and 's' is small.
-        # A type 'G' snowman is a complete snowman.
-        # A type 'A' snowman is formed by placing a medium snowball atop big one.
-        # A type 'B' snowman is formed by placing a small snowball atop medium one.
-        # A type 'C' snowman is formed by placing a small snowball atop big one.
-        self.snowball_sizes = {0: 'b', 1: 'm',
-                               2: 's', 3: 'A', 4: 'B', 5: 'C', 6: 'G'}
+        self.level = get_level(width, height, obstacles, destination)
+        self.robot_cell = self.level.cell(robot)
+        self.balls = tuple(sorted((self.level.cell(location) << _SIZE_BITS) | size
+                                  for location, size in snowballs.items()))
+        self.key = self.level.compute_key(self.robot_cell, self.balls)
+
+    @classmethod
+    def from_level(cls, action, gval, parent, level, robot_cell, balls, key):
+        """
+        Create a state directly from its compact encoding and Zobrist key.
+        """
+        state = cls.__new__(cls)
+        StateSpace.__init__(state, action, gval, parent)
+        state.level = level
+        state.robot_cell = robot_cell
+        state.balls = balls
+        state.key = key
+        return state
+
+    @property
+    def width(self):
+        return self.level.width
+
+    @property
+    def height(self):
+        return self.level.height
+
+    @property
+    def obstacles(self):
+        return self.level.obstacles
+
+    @property
+    def destination(self):
+        return self.level.destination
+
+    @property
+    def robot(self):
+        return self.level.coords[self.robot_cell]
+
+    @property
+    def snowballs(self):
+        coords = self.level.coords
+        return {coords[ball >> _SIZE_BITS]: ball & _SIZE_MASK for ball in self.balls}
 
     def successors(self):
 
@@ -59,81 +167,83 @@ class SnowmanState(StateSpace):
 
         successors = []
         transition_cost = 1
+        level = self.level
+        robot_keys = level.robot_keys
+        ball_keys = level.ball_keys
+        snowballs = {ball >> _SIZE_BITS: ball & _SIZE_MASK for ball in self.balls}
 
-        for direction in (UP, RIGHT, DOWN, LEFT):
+        for direction, moves in zip(DIRECTIONS, level.moves):
 
-            new_location = direction.move(self.robot)
+            new_location = moves[self.robot_cell]
 
-            # if the new location is outside of bounds, skip
-            if new_location[0] < 0 or new_location[0] >= self.width:
-                continue
-            if new_location[1] < 0 or new_location[1] >= self.height:
-                continue
-            if new_location in self.obstacles:
+            # if the new location is outside of bounds or an obstacle, skip
+            if new_location < 0:
                 continue
 
-            new_snowballs = dict(self.snowballs)
-            index = 0
+            new_balls = self.balls
+            new_robot = new_location
+            # update the key of self for everything that moved, starting with the robot
+            new_key = self.key ^ robot_keys[self.robot_cell] ^ robot_keys[new_location]
 
-            if new_location in self.snowballs:  # if the location we're going to is where there's a snowball
-                new_snowball_location = direction.move(
-                    new_location)  # move the snowball
+            if new_location in snowballs:  # if the location we're going to is where there's a snowball
+                new_snowball_location = moves[new_location]  # move the snowball
 
-                # snowball out of bounds?
-                if new_snowball_location[0] < 0 or new_snowball_location[0] >= self.width:
-                    continue
-                if new_snowball_location[1] < 0 or new_snowball_location[1] >= self.height:
-                    continue
-                if new_snowball_location in self.obstacles:
+                # snowball out of bounds or into an obstacle?
+                if new_snowball_location < 0:
                     continue
+
+                pushed = snowballs[new_location]
                 # can't move a complete Snowman
-                if self.snowball_sizes[new_snowballs[new_location]] == 'G':
+                if pushed == 6:  # G
                     continue
 
-                # cases where bigger snowball is pushed atop smaller one(s)
-                if new_snowball_location in new_snowballs:  # if the new snowball location is where there's a snowball
-                    if self.snowball_sizes[new_snowballs[new_snowball_location]] == 'b' and self.snowball_sizes[new_snowballs[new_location]] == 'm':
+                new_snowballs = dict(snowballs)
+                new_key ^= ball_keys[(new_location << _SIZE_BITS) | pushed]
+                if pushed >= 3:
+                    # cases where a stack of snowballs is pushed apart,
+                    # the robot stays where it is
+                    if new_snowball_location in snowballs:
+                        continue
+                    if pushed == 3:  # A
+                        new_snowballs[new_location] = 0  # b
+                        new_snowballs[new_snowball_location] = 1  # m
+                    elif pushed == 4:  # B
+                        new_snowballs[new_location] = 1  # m
+                        new_snowballs[new_snowball_location] = 2  # s
+                    else:  # C
+                        new_snowballs[new_location] = 0  # b
+                        new_snowballs[new_snowball_location] = 2  # s
+                    new_robot = self.robot_cell
+                    new_key ^= (robot_keys[self.robot_cell] ^ robot_keys[new_location] ^
+                                ball_keys[(new_location << _SIZE_BITS) | new_snowballs[new_location]] ^
+                                ball_keys[(new_snowball_location << _SIZE_BITS) | new_snowballs[new_snowball_location]])
+                elif new_snowball_location in snowballs:
+                    # cases where bigger snowball is pushed atop smaller one(s)
+                    below = snowballs[new_snowball_location]
+                    if below == 0 and pushed == 1:
                         index = 3  # will transition to A formation of snowballs
-                    elif self.snowball_sizes[new_snowballs[new_snowball_location]] == 'm' and self.snowball_sizes[new_snowballs[new_location]] == 's':
+                    elif below == 1 and pushed == 2:
                         index = 4  # will transition to B formation of snowballs
-                    elif self.snowball_sizes[new_snowballs[new_snowball_location]] == 'b' and self.snowball_sizes[new_snowballs[new_location]] == 's':
+                    elif below == 0 and pushed == 2:
                         index = 5  # will transition to C formation of snowballs
-                    elif self.snowball_sizes[new_snowballs[new_snowball_location]] == 'A' and self.snowball_sizes[new_snowballs[new_location]] == 's':
+                    elif below == 3 and pushed == 2:
                         index = 6  # will transition to Goal formation of snowballs
                     else:
                         continue
-
-                # cases where a stack of snowballs is pushed apart
-                if self.snowball_sizes[new_snowballs[new_location]] == 'A':
-                    new_snowballs[new_location] = 0  # b
-                    new_snowballs[new_snowball_location] = 1  # m
-                    index = 7
-                if self.snowball_sizes[new_snowballs[new_location]] == 'B':
-                    new_snowballs[new_location] = 1  # m
-                    new_snowballs[new_snowball_location] = 2  # s
-                    index = 7
-                if self.snowball_sizes[new_snowballs[new_location]] == 'C':
-                    new_snowballs[new_location] = 0  # b
-                    new_snowballs[new_snowball_location] = 2  # s
-                    index = 7
-
-                if index == 0:  # case robot has pushed one snowball
-                    index = new_snowballs.pop(new_location)
-                elif index != 7:  # case robot has pushed snowballs stack apart
-                    new_snowballs.pop(new_location)
-                    new_snowballs.pop(new_snowball_location)
-
-                if index < 7:  # case robot has pushed two snowballs together
+                    del new_snowballs[new_location]
                     new_snowballs[new_snowball_location] = index
-
-            if index == 7:  # if robot pushed snowball stack apart, no movement of robot results
-                new_robot = self.robot
-            else:
-                new_robot = tuple(new_location)
-
-            new_state = SnowmanState(action=direction.name, gval=self.gval + transition_cost, parent=self,
-                                     width=self.width, height=self.height, robot=new_robot,
-                                     snowballs=new_snowballs, obstacles=self.obstacles, destination=self.destination)
+                    new_key ^= (ball_keys[(new_snowball_location << _SIZE_BITS) | below] ^
+                                ball_keys[(new_snowball_location << _SIZE_BITS) | index])
+                else:  # case robot has pushed one snowball
+                    del new_snowballs[new_location]
+                    new_snowballs[new_snowball_location] = pushed
+                    new_key ^= ball_keys[(new_snowball_location << _SIZE_BITS) | pushed]
+
+                new_balls = tuple(sorted((location << _SIZE_BITS) | size
+                                         for location, size in new_snowballs.items()))
+
+            new_state = SnowmanState.from_level(direction.name, self.gval + transition_cost, self,
+                                                level, new_robot, new_balls, new_key)
             successors.append(new_state)
 
         return successors
@@ -141,8 +251,9 @@ class SnowmanState(StateSpace):
     def hashable_state(self):
 
         # This is a function that calculates a unique index to represents a particular SnowmanState. It is used to facilitate path and cycle checking.
+        # The index is the Zobrist key, which is computed once per state (incrementally from the parent's key).
 
-        return hash((self.robot, frozenset(self.snowballs.items())))
+        return self.key
 
     def state_string(self):
         """
@@ -208,11 +319,8 @@ def snowman_goal_state(state):
     @param state: a Snowball state
     OUTPUT: True (if goal) or False (if not)
     """
-    for snowball in state.snowballs:
-        # means a complete snowman is on the board and in the right spot
-        if(state.snowball_sizes[state.snowballs[snowball]] == 'G' and snowball[1] == state.destination[1] and snowball[0] == state.destination[0]):
-            return True
-    return False
+    # means a complete snowman (size index 6, 'G') is on the board and in the right spot
+    return ((state.level.destination_cell << _SIZE_BITS) | 6) in state.balls
 
 
 def generate_coordinate_rect(x_start, x_finish, y_start, y_finish):
@@ -274,3 +382,4 @@ UP = Direction("up", (0, -1))
 RIGHT = Direction("right", (1, 0))
 DOWN = Direction("down", (0, 1))
 LEFT = Direction("left", (-1, 0))
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
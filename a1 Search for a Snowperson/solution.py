@@ -87,16 +87,18 @@ def heur_alternate(state):
     # Write a heuristic function that improves upon heur_manhattan_distance to estimate distance between the current state and the goal.
     # Your function should return a numeric value for the estimate of the distance to the goal.
     distance = 0
-    (x, y) = state.destination
-    for ball in state.snowballs:
-        if blocked(ball, state.destination, state.width, state.height, state.obstacles, state.robot):
+    destination = state.destination
+    (x, y) = destination
+    width, height, obstacles, robot = state.width, state.height, state.obstacles, state.robot
+    for ball, size in state.snowballs.items():
+        if blocked(ball, destination, width, height, obstacles, robot):
             return float("inf")  # positive infinity
         length = abs(ball[0] - x) + abs(ball[1] - y)
         # 3 snowballs
-        if state.snowball_sizes[state.snowballs[ball]] == 'G':
+        if state.snowball_sizes[size] == 'G':
             length *= 3
         # 2 snowballs
-        elif state.snowball_sizes[state.snowballs[ball]] in ['A', 'B', 'C']:
+        elif state.snowball_sizes[size] in ['A', 'B', 'C']:
             length *= 2
         distance += length
     return distance
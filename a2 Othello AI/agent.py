@@ -7,17 +7,27 @@ Since the disks at a corner or the disks surrounding it cannot be flipped,
 it is beneficial for the player to place the disks there.
 """
 
-import random
 import sys
 import time
 
 # You can use the functions in othello_shared to write your AI
-from othello_shared import find_lines, get_possible_moves, get_score, play_move
+from othello_shared import get_possible_moves, get_score, OthelloBoard
+from othello_transposition import EXACT, LOWER, UPPER, TranspositionTable
 
-min_dict = dict()
-max_dict = dict()
-beta_dict = dict()
-alpha_dict = dict()
+minimax_table = TranspositionTable()
+alphabeta_table = TranspositionTable()
+
+# Seconds per move used when the depth limit is off. The game manager kills
+# an AI after AiPlayerInterface.TIMEOUT (10) seconds, this leaves a margin
+# for reading the board and printing the move.
+TIME_BUDGET = 9.0
+
+# Wall-clock time at which an iterative deepening search must stop
+search_deadline = None
+
+
+class SearchTimeout(Exception):
+    pass
 
 
 def eprint(*args, **kwargs):  # you can use this for debugging, as it will print to sterr and not stdout
@@ -111,44 +121,88 @@ def compute_heuristic(board, color):
     # IMPLEMENT
     return compute_utility(board, color) * 2 + count_corners(board, color)
 
+############ STATE CACHING #########################
+
+
+def get_node_key(board, player, is_min):
+    """
+    Return the transposition table key of a node: the Zobrist key of the
+    board combined with the player to move and the node type.
+    """
+    node_key = board.key ^ board.zobrist.turn[player]
+    if is_min:
+        node_key ^= board.zobrist.min_node
+    return node_key
+
+
+def get_bound_flag(value, alpha, beta):
+    """
+    Return the flag describing what value is for a search over (alpha, beta).
+    """
+    if value <= alpha:
+        return UPPER
+    if value >= beta:
+        return LOWER
+    return EXACT
+
+
+def is_cutoff(entry, alpha, beta):
+    """
+    Return True if a cached entry decides the node for the window (alpha, beta).
+    """
+    flag, value = entry[2], entry[3]
+    return flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha)
+
 ############ MINIMAX ###############################
 
 
 def minimax_min_node(board, color, limit, caching=0):
     # IMPLEMENT
-    if caching and (board, 3 - color) in min_dict:
-        return min_dict[(board, 3 - color)]
+    if not isinstance(board, OthelloBoard):
+        board = OthelloBoard(board)
+    if caching:
+        node_key = get_node_key(board, 3 - color, True)
+        entry = minimax_table.probe(node_key)
+        if entry is not None and entry[1] >= limit:
+            return entry[4], entry[3]
     min_val, min_node = float("Inf"), None
-    moves = get_possible_moves(board, 3 - color)
+    moves = board.get_possible_moves(3 - color)
     # if at depth limit or no more moves left
     if limit < 1 or moves == []:
         return min_node, compute_utility(board, color)
     for mv in moves:
-        after = play_move(board, 3 - color, mv[0], mv[1])
-        val = minimax_max_node(after, color, limit - 1, caching)[1]
+        board.make_move(3 - color, mv[0], mv[1])
+        val = minimax_max_node(board, color, limit - 1, caching)[1]
+        board.undo_move()
         if val < min_val:
             min_val, min_node = val, mv
     if caching:
-        min_dict[(board, 3 - color)] = min_node, min_val
+        minimax_table.store(node_key, limit, EXACT, min_val, min_node)
     return min_node, min_val
 
 
 def minimax_max_node(board, color, limit, caching=0):  # returns highest possible utility
     # IMPLEMENT
-    if caching and (board, color) in max_dict:
-        return max_dict[(board, color)]
+    if not isinstance(board, OthelloBoard):
+        board = OthelloBoard(board)
+    if caching:
+        node_key = get_node_key(board, color, False)
+        entry = minimax_table.probe(node_key)
+        if entry is not None and entry[1] >= limit:
+            return entry[4], entry[3]
     max_val, max_node = float("-Inf"), None
-    moves = get_possible_moves(board, color)
+    moves = board.get_possible_moves(color)
     # if at depth limit or no more moves left
     if limit < 1 or moves == []:
         return max_node, compute_utility(board, color)
     for mv in moves:
-        after = play_move(board, color, mv[0], mv[1])
-        val = minimax_min_node(after, color, limit - 1, caching)[1]
+        board.make_move(color, mv[0], mv[1])
+        val = minimax_min_node(board, color, limit - 1, caching)[1]
+        board.undo_move()
         if val > max_val:
             max_val, max_node = val, mv
     if caching:
-        max_dict[(board, color)] = max_node, max_val
+        minimax_table.store(node_key, limit, EXACT, max_val, max_node)
     return max_node, max_val
 
 
@@ -166,75 +220,102 @@ def select_move_minimax(board, color, limit, caching=0):
     If caching is OFF (i.e. 0), do NOT use state caching to reduce the number of state evaluations.
     """
     # IMPLEMENT
+    minimax_table.new_search()
     return minimax_max_node(board, color, limit, caching)[0]
 
 ############ ALPHA-BETA PRUNING #####################
 
 
-def sort_board_list(board, color, moves):
-    # get a board from each move
-    board_list = map(lambda mv: play_move(board, color, mv[0], mv[1]), moves)
-    # sort by negative utility
-    return sorted(board_list, key=lambda board: -compute_utility(board, color))
+def order_moves(board, player, color, moves, first=None, reverse=False):
+    """
+    Sort the moves of player by the utility for color of the board they lead to.
+    If first is one of the moves, it is moved to the front.
+    """
+    def utility_after(mv):
+        board.make_move(player, mv[0], mv[1])
+        val = compute_utility(board, color)
+        board.undo_move()
+        return val
+    moves = sorted(moves, key=utility_after, reverse=reverse)
+    if first is not None and first in moves:
+        moves.insert(0, moves.pop(moves.index(first)))
+    return moves
 
 
 def alphabeta_min_node(board, color, alpha, beta, limit, caching=0, ordering=0):
     # IMPLEMENT
-    if caching and (board, 3 - color) in beta_dict:
-        return beta_dict[(board, 3 - color)]
+    if search_deadline is not None and time.time() > search_deadline:
+        raise SearchTimeout
+    if not isinstance(board, OthelloBoard):
+        board = OthelloBoard(board)
+    best_move = None
+    if caching:
+        node_key = get_node_key(board, 3 - color, True)
+        entry = alphabeta_table.probe(node_key)
+        if entry is not None:
+            best_move = entry[4]
+            if entry[1] >= limit and is_cutoff(entry, alpha, beta):
+                return best_move, entry[3]
     min_val, min_node = float("Inf"), None
-    moves = get_possible_moves(board, 3 - color)
+    moves = board.get_possible_moves(3 - color)
     # if at depth limit or no more moves left
     if limit < 1 or moves == []:
         return min_node, compute_utility(board, color)
+    alpha_orig, beta_orig = alpha, beta
     if ordering:
-        board_list = sort_board_list(board, color, moves)
-    for i in range(len(moves)):
-        if ordering:
-            val = alphabeta_max_node(
-                board_list[i], color, alpha, beta, limit - 1, caching, ordering)[1]
-        else:
-            after = play_move(board, 3 - color, moves[i][0], moves[i][1])
-            val = alphabeta_max_node(
-                after, color, alpha, beta, limit - 1, caching, ordering)[1]
+        # the minimizing player tries the replies worst for color first
+        moves = order_moves(board, 3 - color, color, moves, best_move)
+    for mv in moves:
+        board.make_move(3 - color, mv[0], mv[1])
+        val = alphabeta_max_node(
+            board, color, alpha, beta, limit - 1, caching, ordering)[1]
+        board.undo_move()
         if val < min_val:
-            min_val, min_node = val, moves[i]
+            min_val, min_node = val, mv
         if min_val < beta:
             beta = min_val
         if beta <= alpha:  # prune
             break
     if caching:
-        beta_dict[(board, 3 - color)] = min_node, min_val
+        alphabeta_table.store(node_key, limit, get_bound_flag(min_val, alpha_orig, beta_orig), min_val, min_node)
     return min_node, min_val
 
 
 def alphabeta_max_node(board, color, alpha, beta, limit, caching=0, ordering=0):
     # IMPLEMENT
-    if caching and (board, color) in alpha_dict:
-        return alpha_dict[(board, color)]
+    if search_deadline is not None and time.time() > search_deadline:
+        raise SearchTimeout
+    if not isinstance(board, OthelloBoard):
+        board = OthelloBoard(board)
+    best_move = None
+    if caching:
+        node_key = get_node_key(board, color, False)
+        entry = alphabeta_table.probe(node_key)
+        if entry is not None:
+            best_move = entry[4]
+            if entry[1] >= limit and is_cutoff(entry, alpha, beta):
+                return best_move, entry[3]
     max_val, max_node = float("-Inf"), None
-    moves = get_possible_moves(board, color)
+    moves = board.get_possible_moves(color)
     # if at depth limit or no more moves left
     if limit < 1 or moves == []:
         return max_node, compute_utility(board, color)
+    alpha_orig, beta_orig = alpha, beta
     if ordering:
-        board_list = sort_board_list(board, color, moves)
-    for i in range(len(moves)):
-        if ordering:
-            val = alphabeta_min_node(
-                board_list[i], color, alpha, beta, limit - 1, caching, ordering)[1]
-        else:
-            after = play_move(board, color, moves[i][0], moves[i][1])
-            val = alphabeta_min_node(
-                after, color, alpha, beta, limit - 1, caching, ordering)[1]
+        moves = order_moves(board, color, color, moves, best_move, reverse=True)
+    for mv in moves:
+        board.make_move(color, mv[0], mv[1])
+        val = alphabeta_min_node(
+            board, color, alpha, beta, limit - 1, caching, ordering)[1]
+        board.undo_move()
         if val > max_val:
-            max_val, max_node = val, moves[i]
+            max_val, max_node = val, mv
         if max_val > alpha:
             alpha = max_val
         if beta <= alpha:  # prune
             break
     if caching:
-        alpha_dict[(board, color)] = max_node, max_val
+        alphabeta_table.store(node_key, limit, get_bound_flag(max_val, alpha_orig, beta_orig), max_val, max_node)
     return max_node, max_val
 
 
@@ -254,8 +335,56 @@ def select_move_alphabeta(board, color, limit, caching=0, ordering=0):
     If ordering is OFF (i.e. 0), do NOT use node ordering to expedite pruning and reduce the number of state evaluations.
     """
     # IMPLEMENT
+    alphabeta_table.new_search()
     return alphabeta_max_node(board, color, float("-Inf"), float("Inf"), limit, caching, ordering)[0]
 
+############ ITERATIVE DEEPENING ###################
+
+
+def alphabeta_root(board, color, moves, limit, caching=0, ordering=0):
+    """
+    Run an alpha-beta search of depth limit over moves, in the given order,
+    and return the index of the best move in moves.
+    """
+    board = OthelloBoard(board)
+    alpha, best = float("-Inf"), None
+    for index, mv in enumerate(moves):
+        board.make_move(color, mv[0], mv[1])
+        val = alphabeta_min_node(
+            board, color, alpha, float("Inf"), limit - 1, caching, ordering)[1]
+        board.undo_move()
+        if best is None or val > alpha:
+            alpha, best = val, index
+    return best
+
+
+def select_move_iterative(board, color, time_limit, caching=1, ordering=1):
+    """
+    Given a board and a player color, decide on a move within time_limit seconds.
+
+    Alpha-beta searches of depth 1, 2, 3, ... are run until the time is up or
+    the search reaches the end of the game. Each search tries the best move of
+    the previous one first. The search running when the time is up is abandoned
+    and the best move of the deepest completed search is returned.
+    """
+    global search_deadline
+    moves = get_possible_moves(board, color)
+    if not moves:
+        return None
+    empty = sum(row.count(0) for row in board)
+    alphabeta_table.new_search()
+    search_deadline = time.time() + time_limit
+    try:
+        for limit in range(1, empty + 1):
+            # moves[0] is the best move of the deepest completed search
+            best = alphabeta_root(board, color, moves, limit, caching, ordering)
+            moves.insert(0, moves.pop(best))
+    except SearchTimeout:
+        pass
+    finally:
+        search_deadline = None
+    return moves[0]
+
 ####################################################
 
 
@@ -293,6 +422,8 @@ def run_ai():
 
     if (limit == -1):
         eprint("Depth Limit is OFF")
+        if (minimax != 1):
+            eprint("Iterative Deepening for", TIME_BUDGET, "seconds per move")
     else:
         eprint("Depth Limit is ", limit)
 
@@ -323,6 +454,9 @@ def run_ai():
             if (minimax == 1):  # run this if the minimax flag is given
                 movei, movej = select_move_minimax(
                     board, color, limit, caching)
+            elif (limit == -1):  # no depth limit, search until the time is up
+                movei, movej = select_move_iterative(
+                    board, color, TIME_BUDGET, caching, ordering)
             else:  # else run alphabeta
                 movei, movej = select_move_alphabeta(
                     board, color, limit, caching, ordering)
@@ -0,0 +1,182 @@
+"""
+This module contains a bitboard implementation of the Othello rules.
+
+A board of dimension n is stored as two integers, one for the dark disks
+(player 1) and one for the light disks (player 2). The square in column i
+and row j is bit i * n + j, so for the 8x8 and smaller boards the
+OthelloGameManager creates each side fits in a single 64-bit word. Python
+integers are unbounded, so larger dimensions work the same way.
+
+Move generation and flipping use shifts and masks instead of walking the
+board cell by cell. Use to_bitboard and from_bitboard to convert to and
+from the tuple-of-tuples format used by the game manager.
+"""
+
+_geometry_cache = dict()
+
+
+def get_geometry(n):
+    """
+    Return (full, directions) for a board of dimension n.
+    full has a bit set for every square on the board and directions is a
+    list of (shift, mask) pairs, one per compass direction. mask removes
+    the squares a shift would wrap into from the neighbouring column.
+    """
+    if n in _geometry_cache:
+        return _geometry_cache[n]
+    full = (1 << (n * n)) - 1
+    first_row = 0
+    last_row = 0
+    for i in range(n):
+        first_row |= 1 << (i * n)
+        last_row |= 1 << (i * n + n - 1)
+    directions = []
+    for di, dj in [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1),
+                   (-1, 0), (-1, 1)]:
+        mask = full
+        if dj == 1:  # moving down a column must not wrap into row 0
+            mask &= ~first_row
+        elif dj == -1:  # moving up a column must not wrap into row n - 1
+            mask &= ~last_row
+        directions.append((di * n + dj, mask))
+    _geometry_cache[n] = full, directions
+    return full, directions
+
+
+def count_bits(bits):
+    """
+    Return the number of disks in a bitboard. int.bit_count would do
+    but needs Python 3.10.
+    """
+    return bin(bits).count("1")
+
+
+def to_bitboard(board):
+    """
+    Convert a board in the tuple (or list) format into a (dark, light)
+    pair of bitboards.
+    """
+    n = len(board)
+    dark = 0
+    light = 0
+    for j, row in enumerate(board):
+        for i, cell in enumerate(row):
+            if cell == 1:
+                dark |= 1 << (i * n + j)
+            elif cell == 2:
+                light |= 1 << (i * n + j)
+    return dark, light
+
+
+def from_bitboard(dark, light, n):
+    """
+    Convert a (dark, light) pair of bitboards back into a tuple of tuples.
+    """
+    rows = []
+    for j in range(n):
+        row = []
+        for i in range(n):
+            bit = 1 << (i * n + j)
+            if dark & bit:
+                row.append(1)
+            elif light & bit:
+                row.append(2)
+            else:
+                row.append(0)
+        rows.append(tuple(row))
+    return tuple(rows)
+
+
+def split_players(dark, light, player):
+    """
+    Return (own, opponent) bitboards for the given player.
+    """
+    if player == 1:
+        return dark, light
+    return light, dark
+
+
+def join_players(own, opp, player):
+    """
+    Inverse of split_players: return the (dark, light) bitboards.
+    """
+    if player == 1:
+        return own, opp
+    return opp, own
+
+
+def get_move_mask(own, opp, n):
+    """
+    Return a bitboard with a bit set for every square where the player
+    owning own can legally play.
+    """
+    full, directions = get_geometry(n)
+    empty = full & ~(own | opp)
+    moves = 0
+    for shift, mask in directions:
+        if shift > 0:
+            line = (own << shift) & mask & opp
+            for _ in range(n - 3):
+                line |= (line << shift) & mask & opp
+            moves |= (line << shift) & mask & empty
+        else:
+            line = (own >> -shift) & mask & opp
+            for _ in range(n - 3):
+                line |= (line >> -shift) & mask & opp
+            moves |= (line >> -shift) & mask & empty
+    return moves
+
+
+def get_flip_mask(own, opp, n, pos):
+    """
+    Return a bitboard of the opponent disks that are flipped when the
+    player owning own plays on bit index pos.
+    """
+    full, directions = get_geometry(n)
+    flips = 0
+    for shift, mask in directions:
+        line = 0
+        if shift > 0:
+            x = ((1 << pos) << shift) & mask
+            while x & opp:
+                line |= x
+                x = (x << shift) & mask
+        else:
+            x = ((1 << pos) >> -shift) & mask
+            while x & opp:
+                line |= x
+                x = (x >> -shift) & mask
+        if x & own:
+            flips |= line
+    return flips
+
+
+def mask_to_moves(moves, n):
+    """
+    Return the (column,row) tuples of the bits set in moves, ordered by
+    column and then by row.
+    """
+    result = []
+    while moves:
+        low = moves & -moves
+        result.append(divmod(low.bit_length() - 1, n))
+        moves ^= low
+    return result
+
+
+def get_bitboard_moves(own, opp, n):
+    """
+    Return a list of all possible (column,row) tuples for the player
+    owning own.
+    """
+    return mask_to_moves(get_move_mask(own, opp, n), n)
+
+
+def play_bitboard_move(own, opp, n, i, j):
+    """
+    Play column i and row j for the player owning own and return the new
+    (own, opp) pair.
+    """
+    pos = i * n + j
+    flips = get_flip_mask(own, opp, n, pos)
+    return own | flips | (1 << pos), opp & ~flips
@@ -5,6 +5,11 @@ building your AIs.
 
 Thanks to original author Daniel Bauer, Columbia University
 """
+from othello_bitboard import (to_bitboard, from_bitboard, split_players,
+                              join_players, get_bitboard_moves,
+                              play_bitboard_move, get_flip_mask,
+                              count_bits)
+from othello_transposition import get_zobrist_keys
 
 def find_lines(board, i, j, player):
     """
@@ -41,30 +46,18 @@ def get_possible_moves(board, player):
     Return a list of all possible (column,row) tuples that player can play on
     the current board. 
     """
-    result = []
-    for i in range(len(board)):
-        for j in range(len(board)):
-            if board[j][i] == 0:
-                lines = find_lines(board,i,j,player)
-                if lines: 
-                    result.append((i,j))
-    return result
+    own, opp = split_players(*to_bitboard(board), player)
+    return get_bitboard_moves(own, opp, len(board))
 
 def play_move(board, player, i, j):
-    new_board = []
-    for row in board: 
-        new_board.append(list(row[:]))
-    lines = find_lines(board, i,j, player)
-    new_board[j][i] = player
-    for line in lines: 
-        for u,v in line: 
-           new_board[v][u] = player 
-    final = []
-    for row in new_board: 
-        final.append(tuple(row))
-    return tuple(final) 
+    n = len(board)
+    own, opp = split_players(*to_bitboard(board), player)
+    own, opp = play_bitboard_move(own, opp, n, i, j)
+    return from_bitboard(*join_players(own, opp, player), n)
 
 def get_score(board):
+    if isinstance(board, OthelloBoard):
+        return board.get_score()
     p1_count = 0
     p2_count = 0
     for i in range(len(board)):
@@ -74,3 +67,88 @@ def get_score(board):
             elif board[i][j] == 2:
                 p2_count += 1
     return p1_count, p2_count
+
+class OthelloBoard(object):
+    """
+    A mutable board for search. make_move plays a move in place and
+    records the flipped disks on a stack so that undo_move can take it
+    back, which avoids building a new board for every child node.
+    The disk counts and the Zobrist key are updated with every move.
+    """
+
+    def __init__(self, board):
+        self.n = len(board)
+        self.dark, self.light = to_bitboard(board)
+        self.dark_count = count_bits(self.dark)
+        self.light_count = count_bits(self.light)
+        self.zobrist = get_zobrist_keys(self.n)
+        self.key = self.zobrist.compute_key(self.dark, self.light)
+        self.history = []
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, j):
+        """
+        Return row j as a tuple, so code written for the tuple format
+        can still read the board. Only row j is built from the
+        bitboards, so reading a cell costs O(n), not O(n * n).
+        """
+        if isinstance(j, slice):
+            return self.to_tuple()[j]
+        n = self.n
+        if j < 0:
+            j += n
+        if not 0 <= j < n:
+            raise IndexError("board row out of range")
+        dark = self.dark >> j
+        light = self.light >> j
+        row = []
+        for _ in range(n):
+            row.append(1 if dark & 1 else 2 if light & 1 else 0)
+            dark >>= n
+            light >>= n
+        return tuple(row)
+
+    def to_tuple(self):
+        return from_bitboard(self.dark, self.light, self.n)
+
+    def get_score(self):
+        return self.dark_count, self.light_count
+
+    def get_possible_moves(self, player):
+        own, opp = split_players(self.dark, self.light, player)
+        return get_bitboard_moves(own, opp, self.n)
+
+    def make_move(self, player, i, j):
+        pos = i * self.n + j
+        own, opp = split_players(self.dark, self.light, player)
+        flips = get_flip_mask(own, opp, self.n, pos)
+        flipped = count_bits(flips)
+        if player == 1:
+            self.dark |= flips | (1 << pos)
+            self.light &= ~flips
+            self.dark_count += flipped + 1
+            self.light_count -= flipped
+        else:
+            self.light |= flips | (1 << pos)
+            self.dark &= ~flips
+            self.light_count += flipped + 1
+            self.dark_count -= flipped
+        self.key = self.zobrist.update_key(self.key, player, pos, flips)
+        self.history.append((player, pos, flips))
+
+    def undo_move(self):
+        player, pos, flips = self.history.pop()
+        flipped = count_bits(flips)
+        if player == 1:
+            self.dark &= ~(flips | (1 << pos))
+            self.light |= flips
+            self.dark_count -= flipped + 1
+            self.light_count += flipped
+        else:
+            self.light &= ~(flips | (1 << pos))
+            self.dark |= flips
+            self.light_count -= flipped + 1
+            self.dark_count += flipped
+        self.key = self.zobrist.update_key(self.key, player, pos, flips)
@@ -0,0 +1,125 @@
+"""
+This module contains Zobrist hashing and a bounded transposition table
+for the Othello search in agent.py.
+
+A Zobrist key is the XOR of one random 64-bit number per occupied
+(square, colour) pair. Playing a move only touches the new disk and the
+flipped disks, so the key of a child can be derived from the key of its
+parent in a few XORs instead of rehashing the whole board.
+"""
+
+import random
+
+from othello_bitboard import to_bitboard
+
+# Bound flags stored with every entry
+EXACT = 0
+LOWER = 1  # the stored value is a lower bound (the search failed high)
+UPPER = 2  # the stored value is an upper bound (the search failed low)
+
+_zobrist_cache = dict()
+
+
+class ZobristKeys(object):
+    """
+    The random numbers used to hash boards of one dimension.
+    """
+
+    def __init__(self, n, seed=0):
+        rng = random.Random(seed * 1000003 + n)
+        self.n = n
+        # square[player][pos], player 0 is unused
+        self.square = [None]
+        for player in (1, 2):
+            self.square.append([rng.getrandbits(64) for _ in range(n * n)])
+        # XOR-ing flip[pos] changes the colour of the disk on pos
+        self.flip = [a ^ b for a, b in zip(self.square[1], self.square[2])]
+        self.turn = [0, rng.getrandbits(64), rng.getrandbits(64)]
+        self.min_node = rng.getrandbits(64)
+
+    def compute_key(self, dark, light):
+        """
+        Return the key of a (dark, light) pair of bitboards from scratch.
+        """
+        key = 0
+        for player, bits in ((1, dark), (2, light)):
+            table = self.square[player]
+            while bits:
+                low = bits & -bits
+                key ^= table[low.bit_length() - 1]
+                bits ^= low
+        return key
+
+    def update_key(self, key, player, pos, flips):
+        """
+        Return the key after player puts a disk on pos and flips the
+        disks in the bitboard flips.
+        """
+        key ^= self.square[player][pos]
+        flip = self.flip
+        while flips:
+            low = flips & -flips
+            key ^= flip[low.bit_length() - 1]
+            flips ^= low
+        return key
+
+
+def get_zobrist_keys(n):
+    """
+    Return the shared ZobristKeys for boards of dimension n.
+    """
+    if n not in _zobrist_cache:
+        _zobrist_cache[n] = ZobristKeys(n)
+    return _zobrist_cache[n]
+
+
+def compute_key(board):
+    """
+    Return the Zobrist key of a board in the tuple format.
+    """
+    return get_zobrist_keys(len(board)).compute_key(*to_bitboard(board))
+
+
+class TranspositionTable(object):
+    """
+    A fixed-capacity hash table of search results.
+
+    Each slot holds a (key, depth, flag, value, move, age) tuple. A slot
+    is overwritten when it is empty, when it was written during an older
+    search, or when the new result was searched at least as deep as the
+    stored one.
+    """
+
+    def __init__(self, capacity=1 << 18):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.age = 0
+
+    def new_search(self):
+        """
+        Mark the start of a new root search; entries from earlier
+        searches become the first to be replaced.
+        """
+        self.age += 1
+
+    def clear(self):
+        self.slots = [None] * (self.mask + 1)
+        self.age = 0
+
+    def probe(self, key):
+        """
+        Return the entry stored for key, or None.
+        """
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, value, move):
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is None or entry[5] != self.age or depth >= entry[1]:
+            self.slots[index] = (key, depth, flag, value, move, self.age)
@@ -1,5 +1,6 @@
 import time
 import functools
+import itertools
 
 '''Constraint Satisfaction Routines
    A) class Variable
@@ -11,7 +12,7 @@ import functools
       added but NOT deleted from.
       
       To support constraint propagation, the class also maintains a
-      set of flags to indicate if a value is still in its current domain.
+      bitmask to indicate if a value is still in its current domain.
       So one can remove values, add them back, and query if they are 
       still current. 
 
@@ -30,6 +31,11 @@ import functools
       for each variable in the constraint (in the same ORDER as the
       variables of the constraint were specified).
 
+      Subclasses of IntensionalConstraint are specified by a predicate
+      or by their structure instead: AllDiffConstraint and SumConstraint
+      come with their own support tests, so they can be used over many
+      variables without enumerating tuples.
+
     C) Backtracking routine---takes propagator and CSP as arguments
        so that basic backtracking, forward-checking or GAC can be 
        executed depending on the propagator used.
@@ -45,8 +51,10 @@ class Variable:
 
        The variable object offers two types of functionality to support
        search. 
-       (a) It has a current domain, implimented as a set of flags 
-           determining which domain values are "current", i.e., unpruned.
+       (a) It has a current domain, implimented as an integer bitmask
+           whose bit i is set if the i-th domain value is "current",
+           i.e., unpruned, along with a count of the set bits, so that
+           pruning, restoring, membership and size are all O(1).
            - you can prune a value, and restore it.
            - you can obtain a list of values in the current domain, or count
              how many are still there
@@ -81,7 +89,11 @@ class Variable:
         '''
         self.name = name                #text name for variable
         self.dom = list(domain)         #Make a copy of passed domain
-        self.curdom = [True] * len(domain)      #using list
+        self.dom_index = dict()         #value -> index of its bit in curdom
+        for i, val in enumerate(self.dom):
+            self.dom_index.setdefault(val, i)
+        self.curdom = (1 << len(self.dom)) - 1  #bitmask of current values
+        self.curdom_size = len(self.dom)        #number of bits set in curdom
         #for bt_search
         self.assignedValue = None
 
@@ -89,8 +101,10 @@ class Variable:
         '''Add additional domain values to the domain
            Removals not supported removals'''
         for val in values: 
+            self.dom_index.setdefault(val, len(self.dom))
+            self.curdom |= 1 << len(self.dom)
+            self.curdom_size += 1
             self.dom.append(val)
-            self.curdom.append(True)
 
     def domain_size(self):
         '''Return the size of the (permanent) domain'''
@@ -106,11 +120,17 @@ class Variable:
 
     def prune_value(self, value):
         '''Remove value from CURRENT domain'''
-        self.curdom[self.value_index(value)] = False
+        bit = 1 << self.value_index(value)
+        if self.curdom & bit:
+            self.curdom ^= bit
+            self.curdom_size -= 1
 
     def unprune_value(self, value):
         '''Restore value to CURRENT domain'''
-        self.curdom[self.value_index(value)] = True
+        bit = 1 << self.value_index(value)
+        if not self.curdom & bit:
+            self.curdom |= bit
+            self.curdom_size += 1
 
     def cur_domain(self):
         '''return list of values in CURRENT domain (if assigned 
@@ -119,33 +139,45 @@ class Variable:
         if self.is_assigned():
             vals.append(self.get_assigned_value())
         else:
-            for i, val in enumerate(self.dom):
-                if self.curdom[i]:
-                    vals.append(val)
+            bits = self.curdom
+            while bits:
+                low = bits & -bits
+                vals.append(self.dom[low.bit_length() - 1])
+                bits ^= low
         return vals
 
     def in_cur_domain(self, value):
         '''check if value is in CURRENT domain (without constructing list)
            if assigned only assigned value is viewed as being in current 
            domain'''
-        if not value in self.dom:
+        i = self.dom_index.get(value)
+        if i is None:
             return False
+        if self.assignedValue is not None:
+            return value == self.assignedValue
+        else:
+            return (self.curdom >> i) & 1 == 1
+
+    def cur_domain_bits(self):
+        '''return the CURRENT domain as a bitmask over the indices of
+           the domain values (if assigned only the assigned value's bit
+           is set)'''
         if self.is_assigned():
-            return value == self.get_assigned_value()
+            return 1 << self.value_index(self.assignedValue)
         else:
-            return self.curdom[self.value_index(value)]
+            return self.curdom
 
     def cur_domain_size(self):
         '''Return the size of the variables domain (without construcing list)'''
         if self.is_assigned():
             return 1
         else:
-            return(sum(1 for v in self.curdom if v))
+            return self.curdom_size
 
     def restore_curdom(self):
         '''return all values back into CURRENT domain'''
-        for i in range(len(self.curdom)):
-            self.curdom[i] = True
+        self.curdom = (1 << len(self.dom)) - 1
+        self.curdom_size = len(self.dom)
 
     #
     #methods for assigning and unassigning
@@ -184,7 +216,7 @@ class Variable:
     def value_index(self, value):
         '''Domain values need not be numbers, so return the index
            in the domain list of a variable value'''
-        return self.dom.index(value)
+        return self.dom_index[value]
 
     def __repr__(self):
         return("Var-{}".format(self.name))
@@ -196,7 +228,8 @@ class Variable:
         '''Also print the variable domain and current domain'''
         print("Var--\"{}\": Dom = {}, CurDom = {}".format(self.name, 
                                                              self.dom, 
-                                                             self.curdom))
+                                                             [(self.curdom >> i) & 1 == 1
+                                                              for i in range(len(self.dom))]))
 class Constraint: 
     '''Class for defining constraints variable objects specifes an
        ordering over variables.  This ordering is used when calling
@@ -214,34 +247,128 @@ class Constraint:
         in the scope such that this sequence of values satisfies the
         constraints).
 
-        NOTE: This is a very space expensive representation...a proper
-        constraint object would allow for representing the constraint
-        with a function.  
+        The tuples are stored Compact-Table style: column i holds the
+        value of the i-th scope variable in every tuple, and sets of
+        tuples are integer bitsets whose bit k stands for the k-th tuple.
         '''
 
         self.scope = list(scope)
         self.name = name
-        self.sat_tuples = dict()
-
-        #The next object data item 'sup_tuples' will be used to help
-        #support GAC propgation. It allows access to a list of 
-        #satisfying tuples that contain a particular variable/value
-        #pair.
-        self.sup_tuples = dict()
+        self.columns = [[] for _ in self.scope]
+        self.n_tuples = 0
+
+        #The next object data item 'supports' will be used to help
+        #support GAC propgation. It maps a variable/value pair to the
+        #bitset of satisfying tuples that contain it.
+        self.supports = dict()
+
+        #'current' is the bitset of the tuples that are still valid for
+        #the current domains recorded in 'seen' (one cur_domain_bits
+        #mask per scope position, None before the first update).
+        #valid_tuples() brings it up to date when the domains shrink,
+        #first saving the old (current, seen) pair on 'trail', the trail
+        #of the CSP the constraint was added to, which bt_search undoes
+        #on backtracking. Domains that grew without the trail being
+        #undone are detected and current is then rebuilt from scratch.
+        self.current = 0
+        self.seen = [None] * len(self.scope)
+        self.trail = None
 
     def add_satisfying_tuples(self, tuples):
         '''We specify the constraint by adding its complete list of satisfying tuples.'''
+        seen = set(zip(*self.columns))
+        indices = dict()
         for x in tuples:
             t = tuple(x)  #ensure we have an immutable tuple
-            if not t in self.sat_tuples:
-                self.sat_tuples[t] = True
+            if t in seen:
+                continue
+            seen.add(t)
 
             #now put t in as a support for all of the variable values in it
             for i, val in enumerate(t):
-                var = self.scope[i]
-                if not (var,val) in self.sup_tuples:
-                    self.sup_tuples[(var,val)] = []
-                self.sup_tuples[(var,val)].append(t)
+                self.columns[i].append(val)
+                key = (self.scope[i], val)
+                if not key in indices:
+                    indices[key] = []
+                indices[key].append(self.n_tuples)
+            self.n_tuples += 1
+
+        #build each support bitset a byte at a time; or-ing single bits
+        #into a growing int would be quadratic in the table size
+        for key, index_list in indices.items():
+            bits = bytearray((self.n_tuples >> 3) + 1)
+            for k in index_list:
+                bits[k >> 3] |= 1 << (k & 7)
+            self.supports[key] = self.supports.get(key, 0) | int.from_bytes(bits, 'little')
+        self.seen = [None] * len(self.scope)
+
+    @property
+    def sat_tuples(self):
+        '''read-only copy of the satisfying tuples, as a dict mapping
+           each tuple to True'''
+        return dict.fromkeys(zip(*self.columns), True)
+
+    @property
+    def sup_tuples(self):
+        '''read-only copy of the supports, as a dict mapping each
+           variable/value pair to the list of satisfying tuples with it'''
+        tuples = list(zip(*self.columns))
+        sup_tuples = dict()
+        for key, bits in self.supports.items():
+            sup_tuples[key] = [t for k, t in enumerate(tuples) if (bits >> k) & 1]
+        return sup_tuples
+
+    def all_tuples(self):
+        '''return the bitset of all satisfying tuples'''
+        return (1 << self.n_tuples) - 1
+
+    def values_mask(self, var, bits):
+        '''return the union of the supports of the values of var whose
+           indices are set in bits'''
+        mask = 0
+        while bits:
+            low = bits & -bits
+            mask |= self.supports.get((var, var.dom[low.bit_length() - 1]), 0)
+            bits ^= low
+        return mask
+
+    def valid_tuples(self):
+        '''return the bitset of the satisfying tuples whose values are
+           all still in the corresponding variables current domains,
+           updating current for the domains that changed since the last
+           call'''
+        changed = []
+        grown = False
+        for i, var in enumerate(self.scope):
+            bits = var.cur_domain_bits()
+            if bits != self.seen[i]:
+                changed.append((i, var, bits))
+                grown = grown or self.seen[i] is None or bits & ~self.seen[i] != 0
+        if not changed:
+            return self.current
+        if self.trail is not None:
+            self.trail.append((self, self.current, self.seen))
+        self.seen = list(self.seen)
+        if grown:
+            #values came back without the trail being undone: start
+            #again from all the tuples
+            current = self.all_tuples()
+            for i, var in enumerate(self.scope):
+                self.seen[i] = var.cur_domain_bits()
+                current &= self.values_mask(var, self.seen[i])
+        else:
+            current = self.current
+            for i, var, bits in changed:
+                removed = self.seen[i] & ~bits
+                #remove the supports of the pruned values, or keep those of
+                #the remaining ones, whichever takes fewer values
+                if bin(removed).count("1") < bin(bits).count("1"):
+                    current &= ~self.values_mask(var, removed)
+                else:
+                    current &= self.values_mask(var, bits)
+                self.seen[i] = bits
+        self.current = current
+        return current
 
     def get_scope(self):
         '''get list of variables the constraint is over'''
@@ -254,7 +381,12 @@ class Constraint:
            constraints "satisfies" function.  Note the list of values
            are must be ordered in the same order as the list of
            variables in the constraints scope'''
-        return tuple(vals) in self.sat_tuples
+        found = self.all_tuples()
+        for var, val in zip(self.scope, vals):
+            found &= self.supports.get((var, val), 0)
+            if not found:
+                return False
+        return found != 0
 
     def get_n_unasgn(self):
         '''return the number of unassigned variables in the constraint's scope'''
@@ -278,23 +410,248 @@ class Constraint:
            of assignments satisfying the constraint where each value is
            still in the corresponding variables current domain
         '''
-        if (var, val) in self.sup_tuples:
-            for t in self.sup_tuples[(var, val)]:
-                if self.tuple_is_valid(t):
-                    return True
-        return False
+        return self.supports.get((var, val), 0) & self.valid_tuples() != 0
 
     def tuple_is_valid(self, t):
         '''Internal routine. Check if every value in tuple is still in
            corresponding variable domains'''
-        for i, var in enumerate(self.scope):
-            if not var.in_cur_domain(t[i]):
+        for var, val in zip(self.scope, t):
+            if not var.in_cur_domain(val):
                 return False
         return True
 
     def __str__(self):
         return("{}({})".format(self.name,[var.name for var in self.scope]))
 
+class IntensionalConstraint(Constraint):
+    '''Class for constraints defined by a predicate over the values of
+       their scope instead of by a table of satisfying tuples. Use it
+       (or one of the subclasses below) for constraints whose tables
+       would be too large to enumerate'''
+
+    def __init__(self, name, scope, predicate=None):
+        '''create an intensional constraint. predicate is called with
+        the list of values (ordered as the scope) and returns true if
+        and only if they satisfy the constraint. Subclasses may instead
+        override check and has_support'''
+
+        self.scope = list(scope)
+        self.name = name
+        self.predicate = predicate
+        self.residues = dict()
+
+    def add_satisfying_tuples(self, tuples):
+        print("Trying to add satisfying tuples to intensional constraint ", self)
+
+    def check(self, vals):
+        return self.predicate(vals)
+
+    def domain_state(self):
+        '''return a value that changes whenever the current domain of a
+           variable in the scope changes. Subclasses use it to reuse
+           work between calls to has_support'''
+        return tuple((var.curdom, var.assignedValue) for var in self.scope)
+
+    def has_support(self, var, val):
+        '''Search the current domains of the other variables for values
+           that satisfy the predicate together with var=val. This
+           enumerates the domains, so subclasses replace it with
+           something cheaper where they can'''
+        key = (var, val)
+        t = self.residues.get(key)
+        if t is not None and self.tuple_is_valid(t):
+            return True
+        doms = [[val] if scope_var is var else scope_var.cur_domain()
+                for scope_var in self.scope]
+        for t in itertools.product(*doms):
+            if self.check(t):
+                for scope_var, scope_val in zip(self.scope, t):
+                    self.residues[(scope_var, scope_val)] = t
+                return True
+        return False
+
+
+class AllDiffConstraint(IntensionalConstraint):
+    '''All the variables in the scope take different values. Supports
+       are found with Regin's matching algorithm, so has_support answers
+       for generalized arc consistency without enumerating tuples'''
+
+    def __init__(self, name, scope):
+        IntensionalConstraint.__init__(self, name, scope)
+        #value matched to each variable by the last maximum matching,
+        #used as the starting point of the next one
+        self.matching = [None] * len(self.scope)
+        self.state = None
+        self.supported = set()
+
+    def check(self, vals):
+        return len(set(vals)) == len(vals)
+
+    def has_support(self, var, val):
+        state = self.domain_state()
+        if state != self.state:
+            self.supported = self.find_supported()
+            self.state = state
+        return (var, val) in self.supported
+
+    def find_supported(self):
+        '''return the set of (variable, value) pairs that belong to some
+           maximum matching of the variables into their current domains,
+           or an empty set if no matching covers every variable'''
+        doms = [var.cur_domain() for var in self.scope]
+        n = len(doms)
+
+        #maximum matching by augmenting paths, reusing the edges of the
+        #previous matching that are still in the domains
+        val_of = [None] * n
+        var_of = dict()
+        for i, val in enumerate(self.matching):
+            if val is not None and val not in var_of and self.scope[i].in_cur_domain(val):
+                val_of[i] = val
+                var_of[val] = i
+
+        def augment(i, seen):
+            for val in doms[i]:
+                if val in seen:
+                    continue
+                seen.add(val)
+                j = var_of.get(val)
+                if j is None or augment(j, seen):
+                    val_of[i] = val
+                    var_of[val] = i
+                    return True
+            return False
+
+        for i in range(n):
+            if val_of[i] is None and not augment(i, set()):
+                return set()
+        self.matching = val_of
+
+        #directed graph: variable i is node i and value v is node
+        #node_of[v]. Matched edges go variable -> value, the others go
+        #value -> variable
+        values = sorted(set(val for dom in doms for val in dom))
+        node_of = dict((val, n + k) for k, val in enumerate(values))
+        edges = [[] for _ in range(n + len(values))]
+        for i, dom in enumerate(doms):
+            edges[i].append(node_of[val_of[i]])
+            for val in dom:
+                if val != val_of[i]:
+                    edges[node_of[val]].append(i)
+
+        #an edge lies on an even alternating path if it is reachable from
+        #a value no variable is matched to
+        reached = set(node_of[val] for val in values if val not in var_of)
+        stack = list(reached)
+        while stack:
+            u = stack.pop()
+            for w in edges[u]:
+                if w not in reached:
+                    reached.add(w)
+                    stack.append(w)
+
+        #... or on an alternating cycle if both ends share a strongly
+        #connected component (Tarjan)
+        index = dict()
+        low = dict()
+        comp = dict()
+        path = []
+        on_path = set()
+
+        def connect(u):
+            index[u] = low[u] = len(index)
+            path.append(u)
+            on_path.add(u)
+            for w in edges[u]:
+                if w not in index:
+                    connect(w)
+                    low[u] = min(low[u], low[w])
+                elif w in on_path:
+                    low[u] = min(low[u], index[w])
+            if low[u] == index[u]:
+                while True:
+                    w = path.pop()
+                    on_path.discard(w)
+                    comp[w] = u
+                    if w == u:
+                        break
+
+        for u in range(len(edges)):
+            if u not in index:
+                connect(u)
+
+        supported = set()
+        for i, dom in enumerate(doms):
+            for val in dom:
+                v = node_of[val]
+                if val == val_of[i] or v in reached or comp[v] == comp[i]:
+                    supported.add((self.scope[i], val))
+        return supported
+
+
+class SumConstraint(IntensionalConstraint):
+    '''The weighted sum of the variables in the scope equals total.
+       has_support enforces bounds consistency: a value is supported if
+       it lies within the tightest bounds the other variables' bounds
+       allow, even if values inside those bounds have been pruned'''
+
+    def __init__(self, name, scope, total, coefficients=None):
+        '''coefficients gives the weight of each variable in the scope
+        (in scope order); all weights are 1 if it is omitted'''
+        IntensionalConstraint.__init__(self, name, scope)
+        self.total = total
+        if coefficients is None:
+            coefficients = [1] * len(self.scope)
+        self.coefficients = list(coefficients)
+        self.position = dict((var, i) for i, var in enumerate(self.scope))
+        self.state = None
+        self.bounds = None
+
+    def check(self, vals):
+        return sum(a * val for a, val in zip(self.coefficients, vals)) == self.total
+
+    def has_support(self, var, val):
+        state = self.domain_state()
+        if state != self.state:
+            self.bounds = self.find_bounds()
+            self.state = state
+        if self.bounds is None:
+            return False
+        i = self.position[var]
+        lo, hi = self.bounds[i]
+        return lo <= self.coefficients[i] * val <= hi
+
+    def find_bounds(self):
+        '''return, for each variable, the (low, high) bounds on its term
+           (coefficient times value) once every term has been narrowed to
+           what the other terms' bounds leave possible, or None if some
+           term has no value left'''
+        terms = [sorted(a * val for val in var.cur_domain())
+                 for a, var in zip(self.coefficients, self.scope)]
+        if not all(terms):
+            return None
+        lo = [t[0] for t in terms]
+        hi = [t[-1] for t in terms]
+        min_sum = sum(lo)
+        max_sum = sum(hi)
+        changed = True
+        while changed:
+            changed = False
+            for i, t in enumerate(terms):
+                new_lo = max(lo[i], self.total - (max_sum - hi[i]))
+                new_hi = min(hi[i], self.total - (min_sum - lo[i]))
+                #narrow to values that are still in the domain
+                left = [x for x in t if new_lo <= x <= new_hi]
+                if not left:
+                    return None
+                if left[0] != lo[i] or left[-1] != hi[i]:
+                    min_sum += left[0] - lo[i]
+                    max_sum += left[-1] - hi[i]
+                    lo[i] = left[0]
+                    hi[i] = left[-1]
+                    changed = True
+        return list(zip(lo, hi))
+
 class CSP:
     '''Class for packing up a set of variables into a CSP problem.
        Contains various utility routines for accessing the problem.
@@ -309,6 +666,9 @@ class CSP:
         self.vars = []
         self.cons = []
         self.vars_to_cons = dict()
+        #(constraint, current, seen) entries saved by valid_tuples()
+        #before it updates the valid tuples of a table constraint
+        self.trail = []
         for v in vars:
             self.add_var(v)
 
@@ -326,7 +686,7 @@ class CSP:
     def add_constraint(self,c):
         '''Add constraint to CSP. Note that all variables in the 
            constraints scope must already have been added to the CSP'''
-        if not type(c) is Constraint:
+        if not isinstance(c, Constraint):
             print("Trying to add non constraint ", c, " to CSP object")
         else:
             for v in c.scope:
@@ -335,6 +695,18 @@ class CSP:
                     return
                 self.vars_to_cons[v].append(c)
             self.cons.append(c)
+            c.trail = self.trail
+
+    def trail_mark(self):
+        '''return the current position of the trail, see undo_trail'''
+        return len(self.trail)
+
+    def undo_trail(self, mark):
+        '''restore the valid tuples of the table constraints to what
+           they were when trail_mark returned mark'''
+        while len(self.trail) > mark:
+            c, current, seen = self.trail.pop()
+            c.current, c.seen = current, seen
 
     def get_all_cons(self):
         '''return list of all constraints in the CSP'''
@@ -419,6 +791,7 @@ class BT:
             if var.is_assigned():
                 var.unassign()
             var.restore_curdom()
+        self.csp.undo_trail(0)
 
     def restoreUnasgnVar(self, var):
         '''Add variable back to list of unassigned vars'''
@@ -438,6 +811,7 @@ class BT:
             if not v.is_assigned():
                 self.unasgn_vars.append(v)
 
+        mark = self.csp.trail_mark()
         status, prunings = propagator(self.csp) #initial propagate no assigned variables.
         self.nPrunings = self.nPrunings + len(prunings)
 
@@ -453,6 +827,7 @@ class BT:
 
 
         self.restoreValues(prunings)
+        self.csp.undo_trail(mark)
         if status == False:
             print("CSP{} unsolved. Has no solutions".format(self.csp.name))
         if status == True:
@@ -495,6 +870,7 @@ class BT:
                 if self.TRACE:
                     print('  ' * level, "bt_recurse trying", var, "=", val)
 
+                mark = self.csp.trail_mark()
                 var.assign(val)
                 self.nDecisions = self.nDecisions+1
 
@@ -512,6 +888,7 @@ class BT:
                 if self.TRACE:
                     print('  ' * level, "bt_recurse restoring ", prunings)
                 self.restoreValues(prunings)
+                self.csp.undo_trail(mark)
                 var.unassign()
 
             self.restoreUnasgnVar(var)
@@ -69,6 +69,11 @@ var_ordering == a function with the following template
     of the heuristic it implements.
    '''
 
+import heapq
+from collections import deque
+
+from cspbase import IntensionalConstraint, AllDiffConstraint
+
 
 def prop_BT(csp, newVar=None):
     '''Do plain backtracking propagation. That is, do no
@@ -90,12 +95,23 @@ def prop_BT(csp, newVar=None):
 def prop_FC(csp, newVar=None):
     '''Do forward checking. That is check constraints with
        only one uninstantiated variable. Remember to keep
-       track of all pruned variable,value pairs and return '''
+       track of all pruned variable,value pairs and return.
+       An all-different constraint is forward checked as its binary
+       not-equals would be: the value of newVar is pruned from the
+       other unassigned variables of the constraint'''
     # IMPLEMENT
     pruned_vars = []
     cons = csp.get_cons_with_var(newVar) if newVar else csp.get_all_cons()
     for c in cons:
-        if c.get_n_unasgn() == 1:
+        if newVar and isinstance(c, AllDiffConstraint) and c.get_n_unasgn() > 1:
+            val = newVar.get_assigned_value()
+            for s in c.get_unasgn_vars():
+                if s.in_cur_domain(val):
+                    pruned_vars.append((s, val))
+                    s.prune_value(val)
+                    if s.cur_domain_size() == 0:
+                        return False, pruned_vars
+        elif c.get_n_unasgn() == 1:
             unasgn_var = c.get_unasgn_vars()[0]
             if unasgn_var.cur_domain_size() == 0:
                 return False, pruned_vars
@@ -106,25 +122,126 @@ def prop_FC(csp, newVar=None):
     return True, pruned_vars
 
 
-def prop_GAC(csp, newVar=None):
+class GACQueue:
+    '''Queue of constraints waiting to be revised by prop_GAC. A constraint
+       is held at most once: pushing a constraint that is already queued
+       does nothing. Constraints come out first in first out, or in
+       increasing order of order(constraint) when an order is given'''
+
+    def __init__(self, cons, order=None):
+        self.order = order
+        self.queued = set()
+        self.count = 0  #breaks ties between equal keys first in first out
+        self.items = deque() if order is None else []
+        for c in cons:
+            self.push(c)
+
+    def push(self, c):
+        if c in self.queued:
+            return
+        self.queued.add(c)
+        if self.order is None:
+            self.items.append(c)
+        else:
+            heapq.heappush(self.items, (self.order(c), self.count, c))
+            self.count += 1
+
+    def pop(self):
+        if self.order is None:
+            c = self.items.popleft()
+        else:
+            c = heapq.heappop(self.items)[2]
+        self.queued.discard(c)
+        return c
+
+    def __len__(self):
+        return len(self.items)
+
+
+def con_arity(c):
+    '''GAC queue order revising the constraints over fewer variables first'''
+    return len(c.scope)
+
+
+def con_table_size(c):
+    '''GAC queue order revising the constraints with fewer satisfying tuples first'''
+    if isinstance(c, IntensionalConstraint):
+        return float("Inf")
+    return c.n_tuples
+
+
+def revise(csp, c, queue, pruned_vars):
+    '''Prune every value in the scope of c that c.has_support rejects,
+       recording it in pruned_vars, and queue the other constraints on
+       the variables that lost values. Return False on a domain wipeout'''
+    for s in c.get_scope():
+        if s.cur_domain_size() == 0:
+            return False
+        pruned = False
+        for v in s.cur_domain():
+            if not c.has_support(s, v):
+                pruned_vars.append((s, v))
+                s.prune_value(v)
+                pruned = True
+        if pruned:
+            if s.cur_domain_size() == 0:
+                return False
+            for con in csp.vars_to_cons[s]:
+                if con is not c:
+                    queue.push(con)
+    return True
+
+
+def prop_GAC(csp, newVar=None, order=None):
     '''Do GAC propagation. If newVar is None we do initial GAC enforce 
        processing all constraints. Otherwise we do GAC enforce with
-       constraints containing newVar on GAC Queue'''
+       constraints containing newVar on GAC Queue. order is an optional
+       GACQueue order such as con_arity, e.g. pass
+       functools.partial(prop_GAC, order=con_arity) to bt_search'''
     # IMPLEMENT
     pruned_vars = []
     cons = csp.get_cons_with_var(newVar) if newVar else csp.get_all_cons()
-    while len(cons) != 0:
-        c = cons.pop(0)
-        for s in c.get_scope():
-            if s.cur_domain_size() == 0:
+    queue = GACQueue(cons, order)
+    while queue:
+        c = queue.pop()
+        if not revise(csp, c, queue, pruned_vars):
+            return False, pruned_vars
+    return True, pruned_vars
+
+
+def prop_CT(csp, newVar=None, order=None):
+    '''Do GAC propagation with Compact-Table revision. Processes the
+       same GAC Queue as prop_GAC, but revises a constraint by updating
+       its bitset of still valid tuples (see Constraint.valid_tuples)
+       for the values removed since its last revision and pruning every
+       value whose support bitset does not meet it, instead of searching
+       for a support value by value'''
+    pruned_vars = []
+    cons = csp.get_cons_with_var(newVar) if newVar else csp.get_all_cons()
+    queue = GACQueue(cons, order)
+    while queue:
+        c = queue.pop()
+        if isinstance(c, IntensionalConstraint):
+            #no table to intersect: revise as prop_GAC does
+            if not revise(csp, c, queue, pruned_vars):
                 return False, pruned_vars
+            continue
+        valid = c.valid_tuples()
+        if not valid:
+            return False, pruned_vars
+        #pruning values without support leaves the valid tuples unchanged,
+        #so one pass over the scope makes c GAC
+        for s in c.get_scope():
+            pruned = False
             for v in s.cur_domain():
-                if not c.has_support(s, v):
+                if not c.supports.get((s, v), 0) & valid:
                     pruned_vars.append((s, v))
                     s.prune_value(v)
-                    for con in csp.get_cons_with_var(s):
-                        if con != c:
-                            cons.append(con)
+                    pruned = True
+            if pruned:
+                for con in csp.vars_to_cons[s]:
+                    if con is not c:
+                        queue.push(con)
     return True, pruned_vars
 
 
@@ -4,56 +4,110 @@ The auto grader assumes that the following files are in the same directory as th
   - autotest.txt      --> file of untagged words to be tagged by the HMM
   - autosolution.txt  --> file with correct tags for autotest words
 This auto grader generates a file called results.txt that records the test results.
+Run with -cv to cross validate the tagger over training1.txt to training10.txt instead.
 """
 import os
-from random import randint, sample
+import sys
+import time
+from multiprocessing import Pool
+
+import tagger
+
+# training1.txt to training10.txt interned as one document per file, set in each fold process
+corpus = None
+
+
+def load_corpus(folds):
+    """parse each training file once"""
+    return tagger.Corpus.read([f"training{fold}.txt" for fold in folds])
+
+
+def init_fold(shared):
+    """keep the corpus in the fold process; with fork it is shared with the parent, not copied"""
+    global corpus
+    corpus = shared
+
+
+def peak_rss():
+    """return the peak resident memory of this process as text, "n/a" where resource is missing"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return "n/a"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    peak /= 1024 * 1024 if sys.platform == "darwin" else 1024
+    return f"{peak:.1f} MB"
+
+
+def run_fold(document, beams=(), sparse=False):
+    """
+    Train the HMM tagger on every document of the corpus except the given one and tag the words of
+    that document, which are the words of the matching test file, once with the Viterbi algorithm
+    and once per beam width, and again with a SparseHMM if sparse is set. Return a (decoder,
+    accuracy, tagged tokens per second, table bytes) tuple per decoding and the peak resident
+    memory (see peak_rss).
+    """
+    n_documents = len(corpus.documents) - 1
+    training = corpus.select([d for d in range(n_documents) if d != document])
+    test = corpus.select([document])
+    words = [test.words[w] for w in test.word_seq]
+    solution = [test.tags[t] for t in test.tag_seq]
+    sentences = list(tagger.split_sentences(words))
+    results = []
+    for model_class in [tagger.HMM, tagger.SparseHMM] if sparse else [tagger.HMM]:
+        model = model_class.from_corpus(training)
+        for beam in [None] + list(beams):
+            start = time.perf_counter()
+            output = []
+            for sentence in sentences:
+                output.extend(model.decode(sentence, beam))
+            elapsed = time.perf_counter() - start
+            total_matches = sum(tags == correct for tags, correct in zip(output, solution))
+            decoder = "Viterbi" if beam is None else f"beam {beam}"
+            if model_class is tagger.SparseHMM:
+                decoder = "sparse " + decoder
+            results.append((decoder, total_matches / len(words), len(words) / elapsed,
+                            model.table_bytes()))
+    return results, peak_rss()
+
+
+def cross_validate(folds=range(1, 11), processes=None, beams=(), sparse=False):
+    """
+    Run every fold in its own process, all of them concurrently, and print one line per fold and
+    decoding, then the mean accuracy and speed of every decoding.
+    The training files are parsed once here and handed to the fold processes.
+    """
+    folds = list(folds)
+    shared = load_corpus(folds)
+    with Pool(processes, initializer=init_fold, initargs=(shared,), maxtasksperchild=1) as pool:
+        results = pool.starmap(run_fold, [(document, beams, sparse) for document in range(len(folds))],
+                               chunksize=1)
+    for fold, (decodings, peak) in zip(folds, results):
+        for decoder, accuracy, speed, size in decodings:
+            print(f"Fold {fold}, {decoder}: {accuracy*100:.2f}% correct, {speed:.0f} tokens/s, "
+                  f"{size/1024:.0f} KB of tables, {peak} peak RSS")
+    for i, (decoder, _, _, _) in enumerate(results[0][0]):
+        accuracy = sum(decodings[i][1] for decodings, _ in results) / len(results)
+        speed = sum(decodings[i][2] for decodings, _ in results) / len(results)
+        size = sum(decodings[i][3] for decodings, _ in results) / len(results)
+        print(f"Mean {decoder}: {accuracy*100:.2f}% correct, {speed:.0f} tokens/s, "
+              f"{size/1024:.0f} KB of tables")
 
 
 if __name__ == '__main__':
-    # # Invoke the shell command to train and test the HMM tagger
-    # for _ in range(5):
-    #     n = randint(4, 5)
-    #     group = sample(range(1, 10), n)
-    #     value = group[0]
-    #     group = group[1:]
-    #     test_name = f"test{value}.txt"
-    #     sol_name = f"training{value}.txt"
-    #     train_names = ""
-    #     for x in group:
-    #         train_names += f"training{x}.txt "
-    #     print(f"Training on {train_names}, running tests on {test_name}. "
-    #           "Output --> autooutput.txt")
-    #     os.system(
-    #         f"python3 tagger.py -d {train_names} -t {test_name} -o autooutput.txt")
-
-    #     # Compare the contents of the HMM tagger output with the reference solution.
-    #     # Store the missed cases and overall stats in results.txt
-    #     with open("autooutput.txt", "r") as output_file, \
-    #             open(sol_name, "r") as solution_file, \
-    #             open("results.txt", "w") as results_file:
-    #         # Each word is on a separate line in each file.
-    #         output = output_file.readlines()
-    #         solution = solution_file.readlines()
-    #         total_matches = 0
-
-    #         # generate the report
-    #         for index in range(len(output)):
-    #             if output[index] != solution[index]:
-    #                 pass
-    #                 # print(f"Line {index + 1}: "
-    #                 #                    f"expected <{output[index].strip()}> "
-    #                 #                    f"but got <{solution[index].strip()}>\n")
-    #                 # results_file.write(f"Line {index + 1}: "
-    #                 #                    f"expected <{output[index].strip()}> "
-    #                 #                    f"but got <{solution[index].strip()}>\n")
-    #             else:
-    #                 total_matches = total_matches + 1
-
-    #         # Add stats at the end of the results file.
-    #         # results_file.write(f"Total words seen: {len(output)}.\n")
-    #         # results_file.write(f"Total matches: {total_matches}.\n")
-    #         # results_file.write(f"{total_matches/len(output)*100}%\n")
-    #         print(f"Total words seen: {len(output)}.\nTotal matches: {total_matches}.\n{total_matches/len(output)*100}%\n")
+    # "python3 autograder.py -cv" cross validates the tagger over training1.txt to training10.txt
+    # instead of grading autotest.txt, "-b <width> ..." also compares beam searches of those widths
+    # and "-s" repeats every decoding with sparse tables
+    if "-cv" in sys.argv:
+        beams = []
+        if "-b" in sys.argv:
+            for parameter in sys.argv[sys.argv.index("-b")+1:]:
+                if parameter.startswith("-"):
+                    break
+                beams.append(int(parameter))
+        cross_validate(beams=beams, sparse="-s" in sys.argv)
+        sys.exit()
 
     print("Training on autotraining.txt, running tests on autotest.txt. "
           "Output --> autooutput.txt")